@@ -30,6 +30,8 @@ class Hyperparams:
     d = 256 # == hidden units of Text2Mel
     c = 512 # == hidden units of SSRN
     attention_win_size = 3
+    xla_synthesis = False # if True, XLA compiles each conv block of the (fixed-shape) synthesis graph. Never used for training, whose batches are padded to varying lengths.
+    dense_dilated_conv = False # if True, synthesis runs dilated convs as dense convs on zero-injected kernels. Not benchmarked; a size-3 kernel at rate 27 grows to 55 taps.
 
     # data
     data = "/data/private/voice/LJSpeech-1.0"
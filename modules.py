@@ -7,8 +7,34 @@ https://www.github.com/kyubyong/dc_tts
 
 from __future__ import print_function, division
 
+import contextlib
+
 import tensorflow as tf
 
+@contextlib.contextmanager
+def _jit_scope(enabled=True):
+    '''If `enabled`, XLA compiles the ops built in this scope as a cluster.
+    Only build compute here: variables go outside, and the input shapes
+    should be fixed, or XLA recompiles for every new shape.'''
+    if enabled:
+        with tf.contrib.compiler.jit.experimental_jit_scope():
+            yield
+    else:
+        yield
+
+# He initialization shared by all conv kernels
+_CONV_INIT = tf.variance_scaling_initializer(scale=2.0, mode="fan_in", distribution="uniform")
+
+# initial bias of the highway gate T, so layers start out mostly carrying
+_HIGHWAY_T_BIAS = -1.0
+
+
+def _highway_bias_initializer(shape, dtype=tf.float32, partition_info=None):
+    '''Initializes the fused [H; T] highway bias: zeros for H, `_HIGHWAY_T_BIAS` for T.'''
+    num_units = shape[-1] // 2
+    return tf.concat((tf.zeros([num_units], dtype=dtype),
+                      tf.fill([num_units], tf.constant(_HIGHWAY_T_BIAS, dtype=dtype))), 0)
+
 
 def embed(inputs, vocab_size, num_units, zero_pad=True, scope="embedding", reuse=None):
     '''Embeds a given tensor. 
@@ -33,11 +59,12 @@ def embed(inputs, vocab_size, num_units, zero_pad=True, scope="embedding", reuse
                                        dtype=tf.float32, 
                                        shape=[vocab_size, num_units],
                                        initializer=tf.truncated_normal_initializer(mean=0.0, stddev=0.1))
-        if zero_pad:
-            lookup_table = tf.concat((tf.zeros(shape=[1, num_units]), 
-                                      lookup_table[1:, :]), 0)
+        outputs = tf.gather(lookup_table, inputs)
 
-        outputs = tf.nn.embedding_lookup(lookup_table, inputs)
+        if zero_pad:
+            # zero the rows gathered for id 0 instead of rebuilding the table
+            masks = tf.expand_dims(tf.to_float(tf.not_equal(inputs, 0)), -1)
+            outputs *= masks
 
     return outputs
 
@@ -64,6 +91,20 @@ def normalize(inputs,
     return outputs
 
 
+def _normalize_variables(depth, scope="normalize"):
+    '''Creates the beta and gamma of `normalize(..., scope=scope)` ahead of
+    time, so the normalization itself can be built with `reuse=True`.
+
+    Args:
+      depth: An int. Size of the last dimension of the inputs.
+      scope: Scope `normalize` will be called with.
+    '''
+    with tf.variable_scope(scope):
+        tf.contrib.framework.model_variable("beta", shape=[depth],
+                                            initializer=tf.zeros_initializer())
+        tf.contrib.framework.model_variable("gamma", shape=[depth],
+                                            initializer=tf.ones_initializer())
+
 def highwaynet(inputs, num_units=None, scope="highwaynet", reuse=None):
     '''Highway networks, see https://arxiv.org/abs/1505.00387
 
@@ -79,15 +120,99 @@ def highwaynet(inputs, num_units=None, scope="highwaynet", reuse=None):
       A 3D tensor of shape [N, T, W].
     '''
     if not num_units:
-        num_units = inputs.get_shape()[-1]
+        num_units = inputs.get_shape()[-1].value
 
     with tf.variable_scope(scope, reuse=reuse):
-        H = tf.layers.dense(inputs, units=num_units, activation=tf.nn.relu, name="dense1")
-        T = tf.layers.dense(inputs, units=num_units, activation=tf.nn.sigmoid,
-                            bias_initializer=tf.constant_initializer(-1.0), name="dense2")
-        outputs = H * T + inputs * (1. - T)
+        # H and T in a single GEMM
+        tensor = tf.layers.dense(inputs, units=2*num_units,
+                                 bias_initializer=_highway_bias_initializer,
+                                 name="dense")
+        H, T = tf.split(tensor, 2, axis=-1)
+        H = tf.nn.relu(H)
+        T = tf.nn.sigmoid(T)
+        outputs = (H - inputs) * T + inputs # == H*T + inputs*(1-T)
     return outputs
 
+def _compute_dtype_scope(dtype):
+    '''Re-enters the current variable scope so that variables are stored in
+    float32 but read as `dtype`.
+
+    Args:
+      dtype: A `DType`. The dtype the convolution is computed in.
+
+    Returns:
+      A `variable_scope` context manager.
+    '''
+    def cast_getter(getter, *args, **kwargs):
+        kwargs["dtype"] = tf.float32
+        return tf.cast(getter(*args, **kwargs), dtype)
+
+    return tf.variable_scope(tf.get_variable_scope(),
+                             custom_getter=cast_getter if dtype != tf.float32 else None)
+
+def _dilate_kernel(kernel, rate):
+    '''Injects `rate`-1 zeros between the taps of a dilated conv kernel.
+
+    Args:
+      kernel: A 3-D tensor with shape of [size, in_depth, out_depth].
+      rate: An int. Dilation rate.
+
+    Returns:
+      A tensor of shape [(size-1)*rate+1, in_depth, out_depth] that gives the
+        same outputs with a non-dilated conv.
+    '''
+    size, in_depth, out_depth = kernel.get_shape().as_list()
+    kernel = tf.expand_dims(kernel, 1) # (size, 1, in_depth, out_depth)
+    kernel = tf.pad(kernel, [[0, 0], [0, rate - 1], [0, 0], [0, 0]]) # (size, rate, in_depth, out_depth)
+    kernel = tf.reshape(kernel, [size * rate, in_depth, out_depth])
+    return kernel[:(size - 1) * rate + 1]
+
+def _conv1d_variables(params):
+    '''Creates the kernel and bias `tf.layers.conv1d` would, under the same
+    names, so checkpoints still load.
+
+    Args:
+      params: A dict with `in_depth`, `filters`, `kernel_size`, `use_bias`,
+        `kernel_initializer` and `reuse`.
+
+    Returns:
+      A tuple of the kernel, of shape [kernel_size, in_depth, filters], and
+        the bias, or None if `use_bias` is False.
+    '''
+    with tf.variable_scope("conv1d", reuse=params["reuse"]):
+        kernel = tf.get_variable("kernel",
+                                 shape=[params["kernel_size"], params["in_depth"], params["filters"]],
+                                 initializer=params["kernel_initializer"])
+        bias = None
+        if params["use_bias"]:
+            bias = tf.get_variable("bias", shape=[params["filters"]],
+                                   initializer=tf.zeros_initializer())
+    return kernel, bias
+
+def _conv1d_layer(params, kernel, bias, inference_mode=False):
+    '''Applies a conv1d with the variables from `_conv1d_variables`. If
+    `inference_mode` is True and the conv is dilated, runs the equivalent
+    dense conv instead.
+
+    Args:
+      params: A dict with `inputs`, `dilation_rate` and `padding`.
+      kernel: A 3-D tensor with shape of [size, in_depth, filters].
+      bias: A 1-D tensor with shape of [filters] or None.
+      inference_mode: A boolean. If True and the dilation rate is > 1, the
+        kernel is expanded with `_dilate_kernel` so serving runs a plain conv.
+
+    Returns:
+      A 3-D tensor with shape of [batch, time, filters].
+    '''
+    inputs, rate, padding = params["inputs"], params["dilation_rate"], params["padding"].upper()
+    if inference_mode and rate > 1:
+        tensor = tf.nn.conv1d(inputs, _dilate_kernel(kernel, rate), stride=1, padding=padding)
+    else:
+        tensor = tf.nn.convolution(inputs, kernel, padding=padding, dilation_rate=[rate])
+    if bias is not None:
+        tensor = tf.nn.bias_add(tensor, bias)
+    return tensor
+
 def conv1d(inputs,
            filters=None,
            size=1,
@@ -98,7 +223,10 @@ def conv1d(inputs,
            activation_fn=None,
            training=True,
            scope="conv1d",
-           reuse=None):
+           reuse=None,
+           inference_mode=False,
+           dtype=tf.float32,
+           jit=False):
     '''
     Args:
       inputs: A 3-D tensor with shape of [batch, time, depth].
@@ -113,30 +241,49 @@ def conv1d(inputs,
       scope: Optional scope for `variable_scope`.
       reuse: Boolean, whether to reuse the weights of a previous layer
         by the same name.
+      inference_mode: A boolean. If True and `rate` > 1, the dilated kernel is
+        expanded to an equivalent dense one so serving runs a plain conv.
+      dtype: A `DType` or its name. The convolution is computed in `dtype`,
+        e.g. `tf.bfloat16`. Variables are kept in float32; the output is cast
+        back to float32 before the normalization.
+      jit: A boolean. If True, XLA compiles the block as one cluster. Use
+        only with fixed input shapes, e.g. at synthesis.
 
     Returns:
       A masked tensor of the same shape and dtypes as `inputs`.
     '''
+    dtype = tf.as_dtype(dtype)
     with tf.variable_scope(scope):
         if padding.lower() == "causal":
             # pre-padding for causality
             pad_len = (size - 1) * rate  # padding size
-            inputs = tf.pad(inputs, [[0, 0], [pad_len, 0], [0, 0]])
+            if pad_len > 0: # 1-wide kernels are causal as is
+                inputs = tf.pad(inputs, [[0, 0], [pad_len, 0], [0, 0]])
             padding = "valid"
 
+        in_depth = inputs.get_shape()[-1].value
         if filters is None:
-            filters = inputs.get_shape().as_list()[-1]
+            filters = in_depth
 
+        inputs = tf.cast(inputs, dtype)
         params = {"inputs": inputs, "filters": filters, "kernel_size": size,
                   "dilation_rate": rate, "padding": padding, "use_bias": use_bias,
-                  "kernel_initializer": tf.contrib.layers.variance_scaling_initializer(), "reuse": reuse}
+                  "kernel_initializer": _CONV_INIT, "reuse": reuse,
+                  "in_depth": in_depth}
 
-        tensor = tf.layers.conv1d(**params)
-        tensor = normalize(tensor)
-        if activation_fn is not None:
-            tensor = activation_fn(tensor)
+        with _compute_dtype_scope(dtype):
+            kernel, bias = _conv1d_variables(params)
+        _normalize_variables(filters)
 
-        tensor = tf.layers.dropout(tensor, rate=dropout_rate, training=training)
+        # let XLA fuse conv -> norm -> activation -> dropout into one cluster
+        with _jit_scope(jit):
+            tensor = _conv1d_layer(params, kernel, bias, inference_mode)
+            tensor = tf.cast(tensor, tf.float32)
+            tensor = normalize(tensor, reuse=True)
+            if activation_fn is not None:
+                tensor = activation_fn(tensor)
+
+            tensor = tf.layers.dropout(tensor, rate=dropout_rate, training=training)
 
     return tensor
 
@@ -150,7 +297,10 @@ def hc(inputs,
        activation_fn=None,
        training=True,
        scope="hc",
-       reuse=None):
+       reuse=None,
+       inference_mode=False,
+       dtype=tf.float32,
+       jit=False):
     '''
     Args:
       inputs: A 3-D tensor with shape of [batch, time, depth].
@@ -164,37 +314,91 @@ def hc(inputs,
       scope: Optional scope for `variable_scope`.
       reuse: Boolean, whether to reuse the weights of a previous layer
         by the same name.
+      inference_mode: A boolean. If True and `rate` > 1, the dilated kernel is
+        expanded to an equivalent dense one so serving runs a plain conv.
+      dtype: A `DType` or its name. The convolution is computed in `dtype`,
+        e.g. `tf.bfloat16`. Variables are kept in float32; the output is cast
+        back to float32 before the normalization.
+      jit: A boolean. If True, XLA compiles the block as one cluster. Use
+        only with fixed input shapes, e.g. at synthesis.
 
     Returns:
       A masked tensor of the same shape and dtypes as `inputs`.
     '''
     _inputs = inputs
+    dtype = tf.as_dtype(dtype)
     with tf.variable_scope(scope):
         if padding.lower() == "causal":
             # pre-padding for causality
             pad_len = (size - 1) * rate  # padding size
-            inputs = tf.pad(inputs, [[0, 0], [pad_len, 0], [0, 0]])
+            if pad_len > 0: # 1-wide kernels are causal as is
+                inputs = tf.pad(inputs, [[0, 0], [pad_len, 0], [0, 0]])
             padding = "valid"
 
+        in_depth = inputs.get_shape()[-1].value
         if filters is None:
-            filters = inputs.get_shape().as_list()[-1]
+            filters = in_depth
 
 
+        inputs = tf.cast(inputs, dtype)
         params = {"inputs": inputs, "filters": 2*filters, "kernel_size": size,
                   "dilation_rate": rate, "padding": padding, "use_bias": use_bias,
-                  "kernel_initializer": tf.contrib.layers.variance_scaling_initializer(), "reuse": reuse}
+                  "kernel_initializer": _CONV_INIT, "reuse": reuse,
+                  "in_depth": in_depth}
+
+        with _compute_dtype_scope(dtype):
+            kernel, bias = _conv1d_variables(params)
+        _normalize_variables(filters, scope="H1")
+        _normalize_variables(filters, scope="H2")
+
+        with _jit_scope(jit):
+            tensor = _conv1d_layer(params, kernel, bias, inference_mode)
+            tensor = tf.cast(tensor, tf.float32)
+            H1, H2 = tf.split(tensor, 2, axis=-1)
+            H1 = normalize(H1, scope="H1", reuse=True)
+            H2 = normalize(H2, scope="H2", reuse=True)
+            H1 = tf.nn.sigmoid(H1, "gate")
+            H2 = activation_fn(H2, "info") if activation_fn is not None else H2
+            tensor = (H2 - _inputs) * H1 + _inputs # == H1*H2 + (1-H1)*_inputs
+
+            tensor = tf.layers.dropout(tensor, rate=dropout_rate, training=training)
 
-        tensor = tf.layers.conv1d(**params)
-        H1, H2 = tf.split(tensor, 2, axis=-1)
-        H1 = normalize(H1, scope="H1")
-        H2 = normalize(H2, scope="H2")
-        H1 = tf.nn.sigmoid(H1, "gate")
-        H2 = activation_fn(H2, "info") if activation_fn is not None else H2
-        tensor = H1*H2 + (1.-H1)*_inputs
+    return tensor
 
-        tensor = tf.layers.dropout(tensor, rate=dropout_rate, training=training)
+def _upsampled_length(inputs, stride):
+    '''Returns time*`stride` if the time axis of `inputs` is static, else -1.'''
+    time = inputs.get_shape()[1].value
+    return time * stride if time is not None else -1
 
-    return tensor
+def _subkernel_conv1d_transpose(inputs, kernel, stride):
+    '''Transposed conv with `same` padding, without zero insertion.
+
+    Output step m*stride+p only ever sees the kernel taps k with
+    (p + pad_before - k) % stride == 0, so each phase p is a dense conv of
+    `inputs` with those taps. The phases are then interleaved along time.
+
+    Args:
+      inputs: A 3-D tensor with shape of [batch, time, in_depth].
+      kernel: A `conv2d_transpose` kernel of shape [1, size, filters, in_depth].
+        `size` must be >= `stride`.
+      stride: An int. Upsampling factor.
+
+    Returns:
+      A tensor of the shape with [batch, time*stride, filters].
+    '''
+    _, size, filters, _ = kernel.get_shape().as_list()
+    pad_before = max(size - stride, 0) // 2
+    phases = []
+    for phase in range(stride):
+        # offset d -> tap k, such that y[m*stride+phase] += x[m+d] * kernel[k]
+        taps = {(phase + pad_before - k) // stride: k
+                for k in range(size) if (phase + pad_before - k) % stride == 0}
+        offsets = sorted(taps)
+        sub_kernel = tf.stack([tf.transpose(kernel[0, taps[d]]) for d in offsets]) # (len, in_depth, filters)
+        tensor = tf.pad(inputs, [[0, 0], [-offsets[0], offsets[-1]], [0, 0]])
+        phases.append(tf.nn.conv1d(tensor, sub_kernel, stride=1, padding="VALID")) # (N, T, filters)
+    tensor = tf.stack(phases, 2) # (N, T, stride, filters)
+    return tf.reshape(tensor, [tf.shape(tensor)[0], _upsampled_length(inputs, stride), filters])
 
 def conv1d_transpose(inputs,
                      filters=None,
@@ -206,7 +410,9 @@ def conv1d_transpose(inputs,
                      activation=None,
                      training=True,
                      scope="conv1d_transpose",
-                     reuse=None):
+                     reuse=None,
+                     method="subkernel",
+                     dtype=tf.float32):
     '''
         Args:
           inputs: A 3-D tensor with shape of [batch, time, depth].
@@ -221,23 +427,62 @@ def conv1d_transpose(inputs,
           scope: Optional scope for `variable_scope`.
           reuse: Boolean, whether to reuse the weights of a previous layer
             by the same name.
+          method: One of `subkernel`, `zero_insertion` or `subpixel`. `subkernel`
+            runs one dense conv per output phase and interleaves them (`same`
+            padding and `size` >= `stride` only, otherwise falls back).
+            `zero_insertion` is the reference `conv2d_transpose` path.
+            Both share the same variables. `subpixel` is a plain conv with
+            `filters`*`stride` outputs reshaped along time; it has its own
+            variables, so it needs training from scratch.
+          dtype: A `DType` or its name. The convolution is computed in `dtype`,
+            e.g. `tf.bfloat16`. Variables are kept in float32; the output is cast
+            back to float32 before the normalization.
 
         Returns:
           A tensor of the shape with [batch, time*2, depth].
         '''
+    if method not in ("subkernel", "zero_insertion", "subpixel"):
+        raise ValueError("Unknown conv1d_transpose method: {}".format(method))
+
+    dtype = tf.as_dtype(dtype)
     with tf.variable_scope(scope, reuse=reuse):
+        in_depth = inputs.get_shape()[-1].value
         if filters is None:
-            filters = inputs.get_shape().as_list()[-1]
-        inputs = tf.expand_dims(inputs, 1)
-        tensor = tf.layers.conv2d_transpose(inputs,
-                                   filters=filters,
-                                   kernel_size=(1, size),
-                                   strides=(1, stride),
-                                   padding=padding,
-                                   activation=None,
-                                   kernel_initializer=tf.contrib.layers.variance_scaling_initializer(),
-                                   use_bias=use_bias)
-        tensor = tf.squeeze(tensor, 1)
+            filters = in_depth
+        inputs = tf.cast(inputs, dtype)
+        with _compute_dtype_scope(dtype):
+            if method == "subkernel" and padding.lower() == "same" and size >= stride:
+                # same variables as `tf.layers.conv2d_transpose`
+                with tf.variable_scope("conv2d_transpose"):
+                    kernel = tf.get_variable("kernel",
+                                             shape=[1, size, filters, in_depth],
+                                             initializer=_CONV_INIT)
+                    tensor = _subkernel_conv1d_transpose(inputs, kernel, stride)
+                    if use_bias:
+                        bias = tf.get_variable("bias", shape=[filters],
+                                               initializer=tf.zeros_initializer())
+                        tensor = tf.nn.bias_add(tensor, bias)
+            elif method == "subpixel":
+                tensor = tf.layers.conv1d(inputs,
+                                          filters=filters*stride,
+                                          kernel_size=size,
+                                          padding=padding,
+                                          kernel_initializer=_CONV_INIT,
+                                          use_bias=use_bias) # (N, T, stride*filters)
+                tensor = tf.reshape(tensor, [tf.shape(tensor)[0], _upsampled_length(inputs, stride), filters]) # (N, T*stride, filters)
+            else:
+                inputs = tf.expand_dims(inputs, 1) # (N, 1, T, C), channels stay last
+                tensor = tf.layers.conv2d_transpose(inputs,
+                                           filters=filters,
+                                           kernel_size=(1, size),
+                                           strides=(1, stride),
+                                           padding=padding,
+                                           activation=None,
+                                           kernel_initializer=_CONV_INIT,
+                                           use_bias=use_bias,
+                                           data_format="channels_last")
+                tensor = tf.squeeze(tensor, 1)
+        tensor = tf.cast(tensor, tf.float32)
         tensor = normalize(tensor)
         if activation is not None:
             tensor = activation(tensor)
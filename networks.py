@@ -32,12 +32,14 @@ def TextEnc(L, training=True):
                     dropout_rate=hp.dropout_rate,
                     activation_fn=tf.nn.relu,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     tensor = conv1d(tensor,
                     size=1,
                     rate=1,
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
 
     for _ in range(2):
@@ -48,6 +50,8 @@ def TextEnc(L, training=True):
                             dropout_rate=hp.dropout_rate,
                             activation_fn=None,
                             training=training,
+                            jit=(hp.xla_synthesis and not training),
+                            inference_mode=(hp.dense_dilated_conv and not training),
                             scope="HC_{}".format(i)); i += 1
     for _ in range(2):
         tensor = hc(tensor,
@@ -56,6 +60,8 @@ def TextEnc(L, training=True):
                         dropout_rate=hp.dropout_rate,
                         activation_fn=None,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
 
     for _ in range(2):
@@ -65,6 +71,8 @@ def TextEnc(L, training=True):
                         dropout_rate=hp.dropout_rate,
                         activation_fn=None,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
 
     K, V = tf.split(tensor, 2, -1)
@@ -87,6 +95,7 @@ def AudioEnc(S, training=True):
                     dropout_rate=hp.dropout_rate,
                     activation_fn=tf.nn.relu,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     tensor = conv1d(tensor,
                     size=1,
@@ -95,6 +104,7 @@ def AudioEnc(S, training=True):
                     dropout_rate=hp.dropout_rate,
                     activation_fn=tf.nn.relu,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     tensor = conv1d(tensor,
                     size=1,
@@ -102,6 +112,7 @@ def AudioEnc(S, training=True):
                     padding="CAUSAL",
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     for _ in range(2):
         for j in range(4):
@@ -111,6 +122,8 @@ def AudioEnc(S, training=True):
                             padding="CAUSAL",
                             dropout_rate=hp.dropout_rate,
                             training=training,
+                            jit=(hp.xla_synthesis and not training),
+                            inference_mode=(hp.dense_dilated_conv and not training),
                             scope="HC_{}".format(i)); i += 1
     for _ in range(2):
         tensor = hc(tensor,
@@ -119,6 +132,8 @@ def AudioEnc(S, training=True):
                         padding="CAUSAL",
                         dropout_rate=hp.dropout_rate,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
 
     return tensor
@@ -171,6 +186,7 @@ def AudioDec(R, training=True):
                     padding="CAUSAL",
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     for j in range(4):
         tensor = hc(tensor,
@@ -179,6 +195,8 @@ def AudioDec(R, training=True):
                         padding="CAUSAL",
                         dropout_rate=hp.dropout_rate,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
 
     for _ in range(2):
@@ -188,6 +206,8 @@ def AudioDec(R, training=True):
                         padding="CAUSAL",
                         dropout_rate=hp.dropout_rate,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
     for _ in range(3):
         tensor = conv1d(tensor,
@@ -197,6 +217,7 @@ def AudioDec(R, training=True):
                         dropout_rate=hp.dropout_rate,
                         activation_fn=tf.nn.relu,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
                         scope="C_{}".format(i)); i += 1
     # mel_hats
     logits = conv1d(tensor,
@@ -206,6 +227,7 @@ def AudioDec(R, training=True):
                     padding="CAUSAL",
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     Y = tf.nn.sigmoid(logits) # mel_hats
 
@@ -229,6 +251,7 @@ def SSRN(Y, training=True):
                     rate=1,
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     for j in range(2):
         tensor = hc(tensor,
@@ -236,6 +259,8 @@ def SSRN(Y, training=True):
                       rate=3**j,
                       dropout_rate=hp.dropout_rate,
                       training=training,
+                      jit=(hp.xla_synthesis and not training),
+                      inference_mode=(hp.dense_dilated_conv and not training),
                       scope="HC_{}".format(i)); i += 1
     for _ in range(2):
         # -> (B, T/2, c) -> (B, T, c)
@@ -249,6 +274,8 @@ def SSRN(Y, training=True):
                             rate=3**j,
                             dropout_rate=hp.dropout_rate,
                             training=training,
+                            jit=(hp.xla_synthesis and not training),
+                            inference_mode=(hp.dense_dilated_conv and not training),
                             scope="HC_{}".format(i)); i += 1
     # -> (B, T, 2*c)
     tensor = conv1d(tensor,
@@ -257,6 +284,7 @@ def SSRN(Y, training=True):
                     rate=1,
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
     for _ in range(2):
         tensor = hc(tensor,
@@ -264,6 +292,8 @@ def SSRN(Y, training=True):
                         rate=1,
                         dropout_rate=hp.dropout_rate,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
+                        inference_mode=(hp.dense_dilated_conv and not training),
                         scope="HC_{}".format(i)); i += 1
     # -> (B, T, 1+n_fft/2)
     tensor = conv1d(tensor,
@@ -272,6 +302,7 @@ def SSRN(Y, training=True):
                     rate=1,
                     dropout_rate=hp.dropout_rate,
                     training=training,
+                    jit=(hp.xla_synthesis and not training),
                     scope="C_{}".format(i)); i += 1
 
     for _ in range(2):
@@ -281,12 +312,14 @@ def SSRN(Y, training=True):
                         dropout_rate=hp.dropout_rate,
                         activation_fn=tf.nn.relu,
                         training=training,
+                        jit=(hp.xla_synthesis and not training),
                         scope="C_{}".format(i)); i += 1
     logits = conv1d(tensor,
                size=1,
                rate=1,
                dropout_rate=hp.dropout_rate,
                training=training,
+               jit=(hp.xla_synthesis and not training),
                scope="C_{}".format(i))
     Z = tf.nn.sigmoid(logits)
     return logits, Z
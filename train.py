@@ -126,6 +126,9 @@ class Graph:
             self.gvs = self.optimizer.compute_gradients(self.loss)
             self.clipped = []
             for grad, var in self.gvs:
+                if isinstance(grad, tf.IndexedSlices):
+                    # sum duplicate ids (e.g. embedding rows) before clipping
+                    grad = tf.convert_to_tensor(grad)
                 grad = tf.clip_by_value(grad, -1., 1.)
                 self.clipped.append((grad, var))
                 self.train_op = self.optimizer.apply_gradients(self.clipped, global_step=self.global_step)